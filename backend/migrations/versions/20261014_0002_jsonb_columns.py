@@ -0,0 +1,38 @@
+"""store gist payloads as jsonb
+
+Revision ID: 20261014_0002
+Revises: 20260405_0001
+Create Date: 2026-10-14 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "20261014_0002"
+down_revision = "20260405_0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.alter_column("gists", "gist_metadata", type_=postgresql.JSONB(),
+                    existing_type=sa.JSON(), existing_nullable=False,
+                    postgresql_using="gist_metadata::jsonb")
+    op.alter_column("gists", "version_history", type_=postgresql.JSONB(),
+                    existing_type=sa.JSON(), existing_nullable=True,
+                    postgresql_using="version_history::jsonb")
+    op.create_index("gists_metadata_gin", "gists", ["gist_metadata"],
+                    postgresql_using="gin", postgresql_ops={"gist_metadata": "jsonb_path_ops"})
+
+
+def downgrade() -> None:
+    op.drop_index("gists_metadata_gin", table_name="gists")
+    op.alter_column("gists", "version_history", type_=sa.JSON(),
+                    existing_type=postgresql.JSONB(), existing_nullable=True,
+                    postgresql_using="version_history::json")
+    op.alter_column("gists", "gist_metadata", type_=sa.JSON(),
+                    existing_type=postgresql.JSONB(), existing_nullable=False,
+                    postgresql_using="gist_metadata::json")
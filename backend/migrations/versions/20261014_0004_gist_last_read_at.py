@@ -0,0 +1,24 @@
+"""record when a gist was last read
+
+Revision ID: 20261014_0004
+Revises: 20261014_0002
+Create Date: 2026-10-14 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261014_0004"
+down_revision = "20261014_0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("gists", sa.Column("last_read_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("gists", "last_read_at")
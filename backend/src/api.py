@@ -1,64 +1,117 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from fastapi.responses import JSONResponse, Response
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, status, Depends
+from fastapi.responses import ORJSONResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import datetime, timezone
-from .dependencies import get_db
+from datetime import timezone
+import time
+from .dependencies import get_db, get_storage
 from .schemas import GistCreate, GistResponse, GistCreateResponse
-from .crud import create_gist, get_gist, delete_gist
-from .models import Gist
-from .storage import storage
+from .crud import (create_gist, consume_gist_read, is_gist_live, is_gist_expired, delete_gist,
+                   delete_gist_object, purge_gist)
+from .storage import Storage, PRESIGNED_EXPIRES_IN
 
 router = APIRouter()
 
 
+def _gist_etag(gist_id, read_count: int, valid_until: int) -> str:
+    # The deadline lets a conditional GET be answered without counting a read
+    return f'"{gist_id}.{read_count}.{valid_until}"'
+
+
+def _match_etag(if_none_match: str, gist_id: str) -> tuple[str, int] | None:
+    """Return the first ETag in If-None-Match that is ours and whose download URL
+    is still valid, with the seconds it stays valid, or None.
+
+    The tag is not signed, so the caller must still check the gist exists.
+    """
+    now = int(time.time())
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        parts = tag.removeprefix("W/").strip('"').split(".")
+        if len(parts) == 3 and parts[0] == gist_id.lower() and parts[2].isdigit() and int(parts[2]) > now:
+            return tag, int(parts[2]) - now
+    return None
+
+
 @router.post("/api/gists", response_model=GistCreateResponse, status_code=status.HTTP_201_CREATED)
-async def api_create_gist(payload: GistCreate, db: AsyncSession = Depends(get_db)):
-    gist = await create_gist(db, payload.gist_metadata, payload.expiration_date, payload.max_reads)
+async def api_create_gist(payload: GistCreate, db: AsyncSession = Depends(get_db),
+                          storage: Storage = Depends(get_storage)):
+    gist_id = await create_gist(db, payload.gist_metadata, payload.expiration_date, payload.max_reads)
     
     # Generate Presigned POST
-    presigned_post = storage.generate_presigned_post(str(gist.gist_id))
+    presigned_post = storage.generate_presigned_post(str(gist_id))
     if not presigned_post:
         raise HTTPException(status_code=500, detail="Failed to generate upload URL")
 
-    return GistCreateResponse(
-        gist_id=gist.gist_id,
-        upload_params=presigned_post
+    # Fields come straight from the DB and boto3, skip re-validating them
+    # against response_model (kept for the OpenAPI schema). asyncpg returns
+    # its own UUID type, which orjson does not serialize
+    return ORJSONResponse(
+        status_code=status.HTTP_201_CREATED,
+        content={"gist_id": str(gist_id), "upload_params": presigned_post},
     )
 
 
 @router.get("/api/gists/{gist_id}", response_model=GistResponse)
-async def api_get_gist(gist_id: str, db: AsyncSession = Depends(get_db)):
-    gist = await get_gist(db, gist_id)
+async def api_get_gist(gist_id: str, request: Request, background: BackgroundTasks,
+                       db: AsyncSession = Depends(get_db), storage: Storage = Depends(get_storage)):
+    if_none_match = request.headers.get("if-none-match")
+    matched = _match_etag(if_none_match, gist_id) if if_none_match else None
+    # A tag for a deleted or expired gist falls through to the normal read
+    if matched and await is_gist_live(db, gist_id):
+        etag, ttl = matched
+        return Response(status_code=304, headers={"Cache-Control": f"private, max-age={ttl}", "ETag": etag})
+
+    gist = await consume_gist_read(db, gist_id)
     if not gist:
-        raise HTTPException(status_code=404, detail="Gist not found")
-    # Check expiration
-    if gist.expiration_date and gist.expiration_date < datetime.now(timezone.utc).replace(tzinfo=None):
-        await delete_gist(db, gist_id)
-        raise HTTPException(status_code=410, detail="Gist expired")
-    # Check read count
+        expired = await is_gist_expired(db, gist_id)
+        if expired is None:
+            raise HTTPException(status_code=404, detail="Gist not found")
+        # Exhausted gists are left to reap_gists: the last reader's download
+        # URL may still be live. Background tasks only run for returned
+        # responses, not raised exceptions
+        if expired:
+            background.add_task(purge_gist, storage, gist_id)
+        return ORJSONResponse(
+            status_code=410,
+            content={"detail": "Gist expired" if expired else "Read limit exceeded"},
+        )
+
+    download_url = storage.generate_presigned_url(str(gist.gist_id), host=request.headers.get("host"))
+
+    content = {
+        "gist_id": str(gist.gist_id),
+        "download_url": download_url,
+        "gist_metadata": gist.gist_metadata,
+        "expiration_date": gist.expiration_date,
+        "read_count": gist.read_count,
+        "max_reads": gist.max_reads,
+        "version_history": gist.version_history,
+    }
     if gist.read_count >= gist.max_reads:
-        await delete_gist(db, gist_id)
-        raise HTTPException(status_code=410, detail="Read limit exceeded")
-    
-    gist.read_count += 1
-    await db.commit()
-
-    download_url = storage.generate_presigned_url(str(gist.gist_id))
-
-    return GistResponse(
-        gist_id=gist.gist_id,
-        download_url=download_url,
-        gist_metadata=gist.gist_metadata,
-        expiration_date=gist.expiration_date.isoformat() if gist.expiration_date else None,
-        read_count=gist.read_count,
-        max_reads=gist.max_reads,
-        version_history=gist.version_history,
+        # That was the last read, there is nothing left to revalidate against
+        return ORJSONResponse(content=content, headers={"Cache-Control": "no-store"})
+
+    # Clients may reuse the response for as long as the download URL and the gist stay valid
+    now = int(time.time())
+    ttl = PRESIGNED_EXPIRES_IN
+    if gist.expiration_date:
+        expires_at = gist.expiration_date.replace(tzinfo=timezone.utc).timestamp()
+        ttl = max(0, min(ttl, int(expires_at) - now))
+
+    return ORJSONResponse(
+        content=content,
+        headers={
+            "Cache-Control": f"private, max-age={ttl}",
+            "ETag": _gist_etag(gist.gist_id, gist.read_count, now + ttl),
+        },
     )
 
 
 @router.delete("/api/gists/{gist_id}", status_code=204)
-async def api_delete_gist(gist_id: str, db: AsyncSession = Depends(get_db)):
-    gist = await delete_gist(db, gist_id)
-    if not gist:
+async def api_delete_gist(gist_id: str, background: BackgroundTasks, db: AsyncSession = Depends(get_db),
+                          storage: Storage = Depends(get_storage)):
+    deleted_id = await delete_gist(db, gist_id)
+    if not deleted_id:
         raise HTTPException(status_code=404, detail="Gist not found")
+    background.add_task(delete_gist_object, storage, deleted_id)
     return Response(status_code=204)
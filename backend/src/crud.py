@@ -1,44 +1,119 @@
+from sqlalchemy import and_, delete, func, insert, or_, update
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
-from datetime import datetime, timezone
+from datetime import datetime, timedelta
+from .db import SessionLocal
 from .models import Gist
-from .storage import storage
-
-
-async def create_gist(db: AsyncSession, gist_metadata: dict, expiration_date: str = None, max_reads: int = 100):
-    exp_date = None
-    if expiration_date:
-        dt = datetime.fromisoformat(expiration_date)
-        if dt.tzinfo is not None:
-            dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
-        exp_date = dt
-
-    # Create DB record
-    gist = Gist(
-        gist_metadata=gist_metadata,
-        expiration_date=exp_date,
-        max_reads=max_reads
+from .storage import PRESIGNED_EXPIRES_IN, Storage
+
+# Gist has no relationships yet; version_history is a JSONB column. If it is
+# ever normalized into a gist_versions table, declare the relationship with
+# lazy="selectin" (e.g. relationship("GistVersion", lazy="selectin")) so a list
+# of N gists loads their versions in one extra IN (...) query instead of N
+# lazy loads, which AsyncSession cannot do implicitly anyway.
+
+
+async def create_gist(db: AsyncSession, gist_metadata: dict, expiration_date: datetime = None, max_reads: int = 100):
+    # Create DB record, only the generated id is needed back
+    result = await db.execute(
+        insert(Gist)
+        .values(
+            gist_metadata=gist_metadata,
+            expiration_date=expiration_date,
+            max_reads=max_reads
+        )
+        .returning(Gist.gist_id)
     )
-    db.add(gist)
+    gist_id = result.scalar_one()
     await db.commit()
-    await db.refresh(gist)
-    
-    return gist
+
+    return gist_id
+
+
+def _utc_now():
+    # Expiration dates are stored as naive UTC timestamps
+    return func.timezone("utc", func.now())
 
 
-async def get_gist(db: AsyncSession, gist_id: str):
-    result = await db.execute(select(Gist).where(Gist.gist_id == gist_id))
+async def consume_gist_read(db: AsyncSession, gist_id: str):
+    """Atomically count a read, returning None if the gist is missing, expired or exhausted"""
+    result = await db.execute(
+        update(Gist)
+        .where(
+            Gist.gist_id == gist_id,
+            Gist.read_count < Gist.max_reads,
+            or_(Gist.expiration_date.is_(None), Gist.expiration_date > _utc_now()),
+        )
+        .values(read_count=Gist.read_count + 1, last_read_at=_utc_now())
+        .returning(Gist)
+        .execution_options(populate_existing=True)
+    )
     gist = result.scalar_one_or_none()
+    await db.commit()
     return gist
 
 
+async def is_gist_live(db: AsyncSession, gist_id: str) -> bool:
+    """Return whether the gist exists and has not expired, without counting a read"""
+    result = await db.execute(
+        select(Gist.gist_id)
+        .where(
+            Gist.gist_id == gist_id,
+            or_(Gist.expiration_date.is_(None), Gist.expiration_date > _utc_now()),
+        )
+    )
+    return result.scalar_one_or_none() is not None
+
+
+async def is_gist_expired(db: AsyncSession, gist_id: str):
+    """Return whether the gist has expired, or None if it does not exist"""
+    result = await db.execute(
+        select(func.coalesce(Gist.expiration_date <= _utc_now(), False))
+        .where(Gist.gist_id == gist_id)
+    )
+    return result.scalar_one_or_none()
+
+
 async def delete_gist(db: AsyncSession, gist_id: str):
-    result = await db.execute(select(Gist).where(Gist.gist_id == gist_id))
-    gist = result.scalar_one_or_none()
-    if gist:
-        await db.delete(gist)
-        await db.commit()
-        # Delete from S3
-        storage.delete(str(gist.gist_id))
-    return gist
+    """Delete the DB record, returning its id; the S3 object is left to the caller"""
+    result = await db.execute(
+        delete(Gist).where(Gist.gist_id == gist_id).returning(Gist.gist_id))
+    deleted_id = result.scalar_one_or_none()
+    await db.commit()
+    return deleted_id
+
+
+async def delete_gist_object(storage: Storage, gist_id) -> bool:
+    return await storage.delete(str(gist_id))
+
+
+async def purge_gist(storage: Storage, gist_id: str):
+    """Delete a gist and its S3 object outside the request, e.g. as a background task"""
+    async with SessionLocal() as db:
+        deleted_id = await delete_gist(db, gist_id)
+    if deleted_id:
+        await delete_gist_object(storage, deleted_id)
+    return deleted_id
+
+
+async def reap_gists(db: AsyncSession, storage: Storage) -> list:
+    """Delete every expired gist, and every exhausted gist whose last download
+    URL has expired, together with its S3 object"""
+    url_cutoff = _utc_now() - timedelta(seconds=PRESIGNED_EXPIRES_IN)
+    result = await db.execute(
+        delete(Gist)
+        .where(or_(
+            Gist.expiration_date < _utc_now(),
+            and_(
+                Gist.read_count >= Gist.max_reads,
+                or_(Gist.last_read_at.is_(None), Gist.last_read_at < url_cutoff),
+            ),
+        ))
+        .returning(Gist.gist_id)
+    )
+    deleted_ids = list(result.scalars())
+    await db.commit()
+    for gist_id in deleted_ids:
+        await delete_gist_object(storage, gist_id)
+    return deleted_ids
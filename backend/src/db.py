@@ -1,4 +1,5 @@
 import os
+import orjson
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 import dotenv
@@ -7,6 +8,26 @@ dotenv.load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+# The asyncpg dialect registers its own json/jsonb codecs and calls these
+# from them, so orjson handles both directions without a second codec
+JSON_SERIALIZATION = {
+    "json_serializer": lambda obj: orjson.dumps(obj).decode(),
+    "json_deserializer": orjson.loads,
+}
+
+# SQLAlchemy's pool holds the asyncpg connections (the dialect does not use an
+# asyncpg pool of its own), so these settings bound connections per worker:
+# pool_size + max_overflow must stay below the server's max_connections
+# divided by the number of workers.
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    pool_timeout=5,
+    **JSON_SERIALIZATION,
+    echo=False,
+)
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 Base = declarative_base()
@@ -1,5 +1,18 @@
+from functools import lru_cache
 from .db import SessionLocal
+from .storage import Storage
 
 async def get_db():
     async with SessionLocal() as db:
         yield db
+
+
+@lru_cache(maxsize=1)
+def _build_storage() -> Storage:
+    # Built on first use rather than at import; boto3 clients are thread-safe
+    return Storage()
+
+
+async def get_storage() -> Storage:
+    # async so FastAPI calls it inline instead of through the threadpool
+    return _build_storage()
@@ -1,8 +1,64 @@
+import asyncio
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from .api import router
+from .crud import reap_gists
+from .db import SessionLocal
+from .dependencies import get_storage
 
-app = FastAPI(title="SecureGist API", version="0.1.0")
+REAPER_INTERVAL_SECONDS = float(os.getenv("REAPER_INTERVAL_SECONDS", "300"))
+
+logger = logging.getLogger(__name__)
+# Parent of every application module logger (src.api, src.storage, ...)
+app_logger = logging.getLogger(__package__)
+
+
+def start_log_queue() -> tuple[QueueHandler, QueueListener]:
+    """Hand application log records to a background thread so that writing
+    them to stderr never blocks the event loop"""
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(levelname)s [%(name)s] %(message)s"))
+    listener = QueueListener(log_queue, stream_handler)
+    queue_handler = QueueHandler(log_queue)
+    app_logger.addHandler(queue_handler)
+    app_logger.propagate = False
+    listener.start()
+    return queue_handler, listener
+
+
+async def reap_periodically():
+    """Batch-delete expired gists and exhausted gists with no live download URL"""
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL_SECONDS)
+        try:
+            async with SessionLocal() as db:
+                await reap_gists(db, await get_storage())
+        except Exception:
+            logger.exception("Gist reaper run failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    queue_handler, listener = start_log_queue()
+    reaper = asyncio.create_task(reap_periodically())
+    yield
+    reaper.cancel()
+    with suppress(asyncio.CancelledError):
+        await reaper
+    listener.stop()
+    app_logger.removeHandler(queue_handler)
+    app_logger.propagate = True
+
+
+app = FastAPI(title="SecureGist API", version="0.1.0", lifespan=lifespan,
+              default_response_class=ORJSONResponse)
 
 # Define allowed origins for CORS
 origins = [
@@ -1,6 +1,6 @@
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, DateTime, Integer, JSON, LargeBinary
-from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy import String, DateTime, Index, Integer, LargeBinary
+from sqlalchemy.dialects.postgresql import JSONB, UUID as PG_UUID
 from uuid import uuid4
 from datetime import datetime, timezone
 from .db import Base
@@ -8,12 +8,21 @@ from .db import Base
 
 class Gist(Base):
     __tablename__ = "gists"
+    __table_args__ = (
+        Index("gists_metadata_gin", "gist_metadata",
+              postgresql_using="gin", postgresql_ops={"gist_metadata": "jsonb_path_ops"}),
+        # No covering index INCLUDE-ing read_count: every read bumps it, and
+        # indexing it would rule out HOT updates, so each read would also write
+        # an index entry. The primary key lookup is already a one-row probe.
+    )
     gist_id: Mapped[str] = mapped_column(
         PG_UUID(as_uuid=True), primary_key=True, default=uuid4)
-    gist_metadata: Mapped[dict] = mapped_column(JSON, nullable=False)
+    gist_metadata: Mapped[dict] = mapped_column(JSONB, nullable=False)
     created_at: Mapped[datetime] = mapped_column(
         DateTime, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
     expiration_date: Mapped[datetime] = mapped_column(DateTime, nullable=True)
     read_count: Mapped[int] = mapped_column(Integer, default=0)
     max_reads: Mapped[int] = mapped_column(Integer, default=100)
-    version_history: Mapped[list] = mapped_column(JSON, nullable=True)
+    # Not indexed, so bumping it with read_count keeps the update HOT
+    last_read_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    version_history: Mapped[list] = mapped_column(JSONB, nullable=True)
@@ -9,6 +9,8 @@ from alembic.config import Config
 from sqlalchemy import inspect
 from sqlalchemy.ext.asyncio import create_async_engine
 
+INITIAL_REVISION = "20260405_0001"
+
 
 async def _should_bootstrap_with_stamp(database_url: str) -> bool:
     engine = create_async_engine(database_url)
@@ -34,8 +36,9 @@ def main() -> None:
         config.set_main_option("sqlalchemy.url", database_url)
 
         if asyncio.run(_should_bootstrap_with_stamp(database_url)):
-            command.stamp(config, "head")
-            return
+            # Tables created before Alembic match the initial revision; the
+            # later ones still have to run
+            command.stamp(config, INITIAL_REVISION)
 
     command.upgrade(config, "head")
 
@@ -1,13 +1,40 @@
+import orjson
 from pydantic import BaseModel, Field, field_validator
 from typing import Optional, Any, List
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, timezone
 
 
 class GistCreate(BaseModel):
     gist_metadata: dict
-    expiration_date: Optional[str] = None
-    max_reads: Optional[int] = 100
+    expiration_date: Optional[datetime] = None
+    max_reads: int = 100
+
+    @field_validator("max_reads", mode="before")
+    @classmethod
+    def default_max_reads(cls, value: Any) -> Any:
+        # The INSERT binds every value, so a null would reach the NOT NULL
+        # column instead of falling back to its default
+        return 100 if value is None else value
+
+    @field_validator("gist_metadata")
+    @classmethod
+    def check_gist_metadata_encodable(cls, value: dict) -> dict:
+        # Stored and served through orjson, which rejects integers outside the
+        # 64-bit range (and nesting deeper than 255); a 422 beats a 500 later
+        try:
+            orjson.dumps(value)
+        except TypeError as e:
+            raise ValueError(f"gist_metadata cannot be encoded as JSON: {e}") from e
+        return value
+
+    @field_validator("expiration_date")
+    @classmethod
+    def normalize_expiration_date(cls, value: Optional[datetime]) -> Optional[datetime]:
+        # Stored as naive UTC; naive input is already assumed to be UTC
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
 
 
 class GistCreateResponse(BaseModel):
@@ -19,7 +46,7 @@ class GistResponse(BaseModel):
     gist_id: UUID
     download_url: Optional[str] = None
     gist_metadata: dict
-    expiration_date: Optional[str] = None
+    expiration_date: Optional[datetime] = None
     read_count: int
     max_reads: int
     version_history: Optional[List[Any]] = None
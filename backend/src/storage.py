@@ -1,6 +1,23 @@
+import asyncio
 import boto3
+import hashlib
+import hmac
+import logging
 import os
-from botocore.exceptions import ClientError
+import time
+from urllib.parse import quote, urlsplit
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+PRESIGNED_EXPIRES_IN = 3600
+SIGV4_ALGORITHM = "AWS4-HMAC-SHA256"
+
+logger = logging.getLogger(__name__)
+
+
+def _hmac_sha256(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode(), hashlib.sha256).digest()
+
 
 class Storage:
     def __init__(self):
@@ -11,14 +28,77 @@ class Storage:
         # Public endpoint for browser -> S3 communication (Presigned URLs)
         self.public_endpoint_url = os.getenv("S3_PUBLIC_ENDPOINT_URL")
 
-        self.s3_client = boto3.client(
+        # boto3 URLs start with the internal endpoint, rewritten for the browser
+        self._rewrite = bool(self.endpoint_url and self.public_endpoint_url
+                             and self.endpoint_url != self.public_endpoint_url)
+        self._old_prefix, self._new_prefix = self.endpoint_url, self.public_endpoint_url
+
+        # Pin everything boto3 would otherwise resolve per call; custom endpoints
+        # (e.g. MinIO) need path-style addressing, as used by the local signer
+        config = Config(
+            region_name=os.getenv("AWS_REGION", os.getenv("AWS_DEFAULT_REGION", "us-east-1")),
+            signature_version="s3v4",
+            parameter_validation=False,
+            retries={"max_attempts": 2, "mode": "standard"},
+            s3={"addressing_style": "path" if self.endpoint_url else "virtual"},
+        )
+        session = boto3.session.Session()
+        self.s3_client = session.client(
             "s3",
-            endpoint_url=self.endpoint_url
+            endpoint_url=self.endpoint_url,
+            config=config
         )
 
+        # Presigned GET URLs are signed locally (SigV4) instead of going through
+        # the boto3 request pipeline, so resolve everything that is fixed once
+        self._credentials = session.get_credentials()
+        self.region = self.s3_client.meta.region_name
+        base_url = self.public_endpoint_url or self.endpoint_url
+        if base_url:
+            # Custom endpoints (e.g. MinIO) use path-style addressing
+            parts = urlsplit(base_url)
+            bucket_path = f"/{quote(self.bucket_name)}/"
+            if parts.netloc:
+                default_port = {"http": ":80", "https": ":443"}.get(parts.scheme, "")
+                self._host = parts.netloc.removesuffix(default_port) if default_port else parts.netloc
+                self._url_prefix = f"{parts.scheme}://{self._host}{parts.path.rstrip('/')}{bucket_path}"
+                self._signed_path_prefix = f"{parts.path.rstrip('/')}{bucket_path}"
+            else:
+                # Relative public endpoint (e.g. "/s3") served by a reverse proxy that
+                # strips the prefix; the host is only known per request
+                self._host = None
+                self._url_prefix = f"{parts.path.rstrip('/')}{bucket_path}"
+                self._signed_path_prefix = bucket_path
+        else:
+            self._host = f"{self.bucket_name}.s3.{self.region}.amazonaws.com"
+            self._url_prefix = f"https://{self._host}/"
+            self._signed_path_prefix = "/"
+        # Hash states seeded with the invariant parts of the canonical request;
+        # each signature copies them and feeds only the per-call bytes
+        self._canonical_prefix_hasher = hashlib.sha256(f"GET\n{self._signed_path_prefix}".encode())
+        self._canonical_suffix = self._canonical_headers(self._host) if self._host else None
+        self._string_to_sign_cache = (None, None, None)
+
+    @staticmethod
+    def _canonical_headers(host: str) -> bytes:
+        return f"\nhost:{host}\n\nhost\nUNSIGNED-PAYLOAD".encode()
+
+    def _string_to_sign_hasher(self, date_stamp: str, secret_key: str):
+        """HMAC keyed with the SigV4 signing key and seeded with the algorithm line,
+        cached until the UTC date or secret changes"""
+        cached_date, cached_secret, hasher = self._string_to_sign_cache
+        if cached_date != date_stamp or cached_secret != secret_key:
+            k_date = _hmac_sha256(("AWS4" + secret_key).encode(), date_stamp)
+            k_region = _hmac_sha256(k_date, self.region)
+            k_service = _hmac_sha256(k_region, "s3")
+            k_signing = _hmac_sha256(k_service, "aws4_request")
+            hasher = hmac.new(k_signing, f"{SIGV4_ALGORITHM}\n".encode(), hashlib.sha256)
+            self._string_to_sign_cache = (date_stamp, secret_key, hasher)
+        return hasher
+
     def _replace_endpoint(self, url: str) -> str:
-        if self.endpoint_url and self.public_endpoint_url and self.endpoint_url in url:
-            return url.replace(self.endpoint_url, self.public_endpoint_url)
+        if self._rewrite and url.startswith(self._old_prefix):
+            return self._new_prefix + url[len(self._old_prefix):]
         return url
 
     def generate_presigned_post(self, key: str, max_size_bytes: int = 10485760) -> dict | None:
@@ -31,7 +111,7 @@ class Storage:
                 Conditions=[
                     ["content-length-range", 0, max_size_bytes]
                 ],
-                ExpiresIn=3600
+                ExpiresIn=PRESIGNED_EXPIRES_IN
             )
             
             # Replace internal endpoint with public endpoint in the URL
@@ -39,30 +119,64 @@ class Storage:
                 response['url'] = self._replace_endpoint(response['url'])
                 
             return response
-        except ClientError as e:
-            print(f"S3 Presigned Post Error: {e}")
+        except ClientError:
+            logger.exception("S3 presigned POST failed")
             return None
 
-    def generate_presigned_url(self, key: str) -> str | None:
-        """Generate a presigned URL to share an S3 object"""
-        try:
-            response = self.s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': self.bucket_name, 'Key': key},
-                ExpiresIn=3600
-            )
-            return self._replace_endpoint(response) if response else None
-        except ClientError as e:
-            print(f"S3 Presigned URL Error: {e}")
+    def generate_presigned_url(self, key: str, host: str | None = None) -> str | None:
+        """Generate a presigned URL to share an S3 object.
+
+        `host` is the Host the browser will send, required when the public
+        endpoint is a relative path and ignored otherwise.
+        """
+        if self._credentials is None:
+            logger.error("S3 presigned URL failed: no credentials available")
             return None
+        canonical_suffix = self._canonical_suffix
+        if canonical_suffix is None:
+            if not host:
+                logger.error("S3 presigned URL failed: host required for relative public endpoint")
+                return None
+            canonical_suffix = self._canonical_headers(host)
+        credentials = self._credentials.get_frozen_credentials()
+
+        amz_date = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        date_stamp = amz_date[:8]
+        scope = f"{date_stamp}/{self.region}/s3/aws4_request"
+
+        # Query parameters must stay sorted by name
+        query = (
+            f"X-Amz-Algorithm={SIGV4_ALGORITHM}"
+            f"&X-Amz-Credential={quote(credentials.access_key + '/' + scope, safe='')}"
+            f"&X-Amz-Date={amz_date}"
+            f"&X-Amz-Expires={PRESIGNED_EXPIRES_IN}"
+        )
+        if credentials.token:
+            query += f"&X-Amz-Security-Token={quote(credentials.token, safe='')}"
+        query += "&X-Amz-SignedHeaders=host"
+
+        quoted_key = quote(key)
+        canonical_hasher = self._canonical_prefix_hasher.copy()
+        canonical_hasher.update(quoted_key.encode())
+        canonical_hasher.update(b"\n")
+        canonical_hasher.update(query.encode())
+        canonical_hasher.update(canonical_suffix)
+
+        signer = self._string_to_sign_hasher(date_stamp, credentials.secret_key).copy()
+        signer.update(f"{amz_date}\n{scope}\n{canonical_hasher.hexdigest()}".encode())
+
+        return "".join((
+            self._url_prefix, quoted_key, "?", query,
+            "&X-Amz-Signature=", signer.hexdigest(),
+        ))
 
-    def delete(self, key: str) -> bool:
+    async def delete(self, key: str) -> bool:
         try:
-            self.s3_client.delete_object(Bucket=self.bucket_name, Key=key)
+            # boto3 is synchronous, keep the HTTP round-trip off the event loop
+            await asyncio.to_thread(self.s3_client.delete_object, Bucket=self.bucket_name, Key=key)
             return True
-        except ClientError as e:
-            print(f"S3 Delete Error: {e}")
+        except (BotoCoreError, ClientError):
+            # Also covers connection errors, so an S3 outage only logs
+            logger.exception("S3 delete failed for %s", key)
             return False
 
-# Singleton instance
-storage = Storage()
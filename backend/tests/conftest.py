@@ -1,19 +1,24 @@
+import asyncio
 import pytest
 from unittest.mock import MagicMock, patch
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Generator
 from pathlib import Path
 from httpx import AsyncClient, ASGITransport
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
 from sqlalchemy import text
+from sqlalchemy.pool import NullPool
 from alembic import command
 from alembic.config import Config
 from src.main import app
-from src.db import DATABASE_URL
-from src.dependencies import get_db
+from src.db import DATABASE_URL, JSON_SERIALIZATION
+from src.dependencies import get_db, get_storage
 
 
 BACKEND_ROOT = Path(__file__).resolve().parents[1]
 
+# One transport for the whole suite, clients are still opened per test
+transport = ASGITransport(app=app)
+
 
 def reset_database() -> None:
     config = Config(str(BACKEND_ROOT / "alembic.ini"))
@@ -33,53 +38,64 @@ class MockStorage:
             "fields": {"key": key, "AWSAccessKeyId": "test", "policy": "test", "signature": "test"}
         }
 
-    def generate_presigned_url(self, key: str) -> str | None:
+    def generate_presigned_url(self, key: str, host: str | None = None) -> str | None:
         return f"https://s3.amazonaws.com/bucket/{key}?signature=test"
 
-    def delete(self, key: str) -> bool:
+    async def delete(self, key: str) -> bool:
         if key in self.store:
             del self.store[key]
         return True
 
 
-@pytest.fixture(scope="function", autouse=True)
-def mock_storage():
-    mock = MockStorage()
-    with patch("src.api.storage", mock):
-        with patch("src.crud.storage", mock):
-            yield mock
-
-
 @pytest.fixture(scope="function")
-async def db_session() -> AsyncGenerator[AsyncSession, None]:
-    # Use a separate engine for each test to ensure no loop conflicts
-    test_engine = create_async_engine(DATABASE_URL, echo=False)
-    TestSessionLocal = async_sessionmaker(test_engine, expire_on_commit=False)
+def mock_storage() -> MockStorage:
+    return MockStorage()
 
-    # Ensure clean state and apply the current schema through Alembic
-    async with test_engine.begin() as conn:
+
+async def drop_schema(engine: AsyncEngine) -> None:
+    async with engine.begin() as conn:
         await conn.execute(text("DROP SCHEMA IF EXISTS public CASCADE"))
         await conn.execute(text("CREATE SCHEMA public"))
 
+
+@pytest.fixture(scope="session")
+def test_engine() -> Generator[AsyncEngine, None, None]:
+    # NullPool opens connections on the loop that uses them, so the engine can
+    # outlive the per-test event loops
+    engine = create_async_engine(DATABASE_URL, echo=False, poolclass=NullPool, **JSON_SERIALIZATION)
+
+    # Build the schema once through Alembic; sync fixture so Alembic's own
+    # asyncio.run() does not nest inside a running loop
+    asyncio.run(drop_schema(engine))
     reset_database()
 
-    async with TestSessionLocal() as session:
-        yield session
+    yield engine
 
-    # Cleanup
+    asyncio.run(drop_schema(engine))
+    asyncio.run(engine.dispose())
+
+
+@pytest.fixture(scope="function")
+async def db_session(test_engine: AsyncEngine) -> AsyncGenerator[AsyncSession, None]:
+    # Cheap reset between tests instead of rebuilding the schema
     async with test_engine.begin() as conn:
-        await conn.execute(text("DROP SCHEMA IF EXISTS public CASCADE"))
-        await conn.execute(text("CREATE SCHEMA public"))
+        await conn.execute(text("TRUNCATE gists RESTART IDENTITY"))
+
+    TestSessionLocal = async_sessionmaker(test_engine, expire_on_commit=False)
 
-    await test_engine.dispose()
+    # Background purges open their own sessions
+    with patch("src.crud.SessionLocal", TestSessionLocal):
+        async with TestSessionLocal() as session:
+            yield session
 
 
 @pytest.fixture(scope="function")
-async def client(db_session: AsyncSession) -> AsyncGenerator[AsyncClient, None]:
+async def client(db_session: AsyncSession, mock_storage: MockStorage) -> AsyncGenerator[AsyncClient, None]:
     async def override_get_db():
         yield db_session
 
     app.dependency_overrides[get_db] = override_get_db
-    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+    app.dependency_overrides[get_storage] = lambda: mock_storage
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
         yield ac
     app.dependency_overrides.clear()
@@ -1,6 +1,12 @@
 import pytest
 from httpx import AsyncClient
 from datetime import datetime, timedelta, timezone
+from uuid import UUID
+from sqlalchemy import update
+from src.crud import reap_gists
+from src.models import Gist
+from src.schemas import GistResponse
+from src.storage import PRESIGNED_EXPIRES_IN
 
 @pytest.mark.asyncio
 async def test_create_gist(client: AsyncClient):
@@ -15,6 +21,25 @@ async def test_create_gist(client: AsyncClient):
     assert "upload_params" in data
     assert "url" in data["upload_params"]
 
+@pytest.mark.asyncio
+async def test_create_gist_null_max_reads(client: AsyncClient):
+    # The frontend sends null once the Max Reads box is cleared
+    create_res = await client.post("/api/gists", json={"gist_metadata": {}, "max_reads": None})
+    assert create_res.status_code == 201
+
+    get_res = await client.get(f"/api/gists/{create_res.json()['gist_id']}")
+    assert get_res.json()["max_reads"] == 100
+
+@pytest.mark.asyncio
+async def test_create_gist_rejects_oversized_integer(client: AsyncClient):
+    # Valid JSON, but wider than orjson can encode into the JSONB column
+    response = await client.post(
+        "/api/gists",
+        content='{"gist_metadata": {"n": 123456789012345678901234567890}}',
+        headers={"Content-Type": "application/json"},
+    )
+    assert response.status_code == 422
+
 @pytest.mark.asyncio
 async def test_get_gist(client: AsyncClient):
     # 1. Create
@@ -32,6 +57,60 @@ async def test_get_gist(client: AsyncClient):
     assert "download_url" in data
     assert "https://s3.amazonaws.com/bucket/" in data["download_url"]
     assert data["read_count"] == 1  # Incremented on read
+    # Responses are built by hand, keep them in line with the schema
+    assert GistResponse.model_validate(data).gist_id == UUID(gist_id)
+
+@pytest.mark.asyncio
+async def test_get_gist_conditional(client: AsyncClient):
+    create_res = await client.post("/api/gists", json={"gist_metadata": {}, "max_reads": 5})
+    gist_id = create_res.json()["gist_id"]
+
+    get_res = await client.get(f"/api/gists/{gist_id}")
+    assert get_res.headers["cache-control"] == "private, max-age=3600"
+    etag = get_res.headers["etag"]
+
+    # Revalidation is answered without counting a read, echoing only the matched tag
+    cached_res = await client.get(f"/api/gists/{gist_id}", headers={"If-None-Match": f'"other", {etag}'})
+    assert cached_res.status_code == 304
+    assert cached_res.headers["etag"] == etag
+    assert cached_res.headers["cache-control"].startswith("private, max-age=")
+
+    get_res = await client.get(f"/api/gists/{gist_id}")
+    assert get_res.json()["read_count"] == 2
+    assert get_res.headers["etag"] != etag
+
+    # ETags whose download URL has expired are not honoured
+    stale_res = await client.get(f"/api/gists/{gist_id}", headers={"If-None-Match": f'"{gist_id}.2.0"'})
+    assert stale_res.status_code == 200
+
+    # Nor are ETags for a gist that has since been deleted
+    etag = stale_res.headers["etag"]
+    await client.delete(f"/api/gists/{gist_id}")
+    deleted_res = await client.get(f"/api/gists/{gist_id}", headers={"If-None-Match": etag})
+    assert deleted_res.status_code == 404
+
+@pytest.mark.asyncio
+async def test_get_gist_last_read_is_not_cached(client: AsyncClient):
+    create_res = await client.post("/api/gists", json={"gist_metadata": {}, "max_reads": 1})
+    gist_id = create_res.json()["gist_id"]
+
+    get_res = await client.get(f"/api/gists/{gist_id}")
+    assert get_res.status_code == 200
+    assert get_res.headers["cache-control"] == "no-store"
+    assert "etag" not in get_res.headers
+
+@pytest.mark.asyncio
+async def test_get_gist_expiration_date(client: AsyncClient):
+    payload = {
+        "gist_metadata": {},
+        "expiration_date": "2999-01-01T14:00:00+02:00"
+    }
+    create_res = await client.post("/api/gists", json=payload)
+    gist_id = create_res.json()["gist_id"]
+
+    get_res = await client.get(f"/api/gists/{gist_id}")
+    assert get_res.status_code == 200
+    assert get_res.json()["expiration_date"] == "2999-01-01T12:00:00"
 
 @pytest.mark.asyncio
 async def test_read_limit(client: AsyncClient):
@@ -82,3 +161,62 @@ async def test_delete_gist(client: AsyncClient):
     # 3. Get (should fail - 404 Not Found)
     get_res = await client.get(f"/api/gists/{gist_id}")
     assert get_res.status_code == 404
+
+@pytest.mark.asyncio
+async def test_expired_gist_is_purged(client: AsyncClient):
+    # 1. Create already expired
+    past_date = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+    create_res = await client.post("/api/gists", json={"gist_metadata": {}, "expiration_date": past_date})
+    gist_id = create_res.json()["gist_id"]
+
+    # 2. The 410 response schedules the cleanup
+    res = await client.get(f"/api/gists/{gist_id}")
+    assert res.status_code == 410
+    assert res.json()["detail"] == "Gist expired"
+
+    # 3. Get (should fail - 404 Not Found once purged)
+    res = await client.get(f"/api/gists/{gist_id}")
+    assert res.status_code == 404
+
+@pytest.mark.asyncio
+async def test_exhausted_gist_is_left_to_reaper(client: AsyncClient):
+    # 1. Create with max_reads=1 and use it up
+    create_res = await client.post("/api/gists", json={"gist_metadata": {}, "max_reads": 1})
+    gist_id = create_res.json()["gist_id"]
+    await client.get(f"/api/gists/{gist_id}")
+
+    # 2. The last reader's download URL is still valid, so nothing is purged
+    for _ in range(2):
+        res = await client.get(f"/api/gists/{gist_id}")
+        assert res.status_code == 410
+        assert res.json()["detail"] == "Read limit exceeded"
+
+@pytest.mark.asyncio
+async def test_reap_gists(client: AsyncClient, db_session, mock_storage):
+    past_date = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+    expired_res = await client.post("/api/gists", json={"gist_metadata": {}, "expiration_date": past_date})
+    live_res = await client.post("/api/gists", json={"gist_metadata": {}})
+
+    reaped = await reap_gists(db_session, mock_storage)
+    assert [str(gist_id) for gist_id in reaped] == [expired_res.json()["gist_id"]]
+
+    res = await client.get(f"/api/gists/{live_res.json()['gist_id']}")
+    assert res.status_code == 200
+
+@pytest.mark.asyncio
+async def test_reap_gists_keeps_exhausted_gist_while_url_is_live(client: AsyncClient, db_session, mock_storage):
+    create_res = await client.post("/api/gists", json={"gist_metadata": {}, "max_reads": 1})
+    gist_id = create_res.json()["gist_id"]
+    await client.get(f"/api/gists/{gist_id}")
+
+    # The last reader's download URL is still valid
+    assert await reap_gists(db_session, mock_storage) == []
+
+    await db_session.execute(
+        update(Gist)
+        .where(Gist.gist_id == gist_id)
+        .values(last_read_at=Gist.last_read_at - timedelta(seconds=PRESIGNED_EXPIRES_IN + 1))
+    )
+    await db_session.commit()
+    reaped = await reap_gists(db_session, mock_storage)
+    assert [str(reaped_id) for reaped_id in reaped] == [gist_id]
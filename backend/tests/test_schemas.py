@@ -1,6 +1,7 @@
 import pytest
 from src.schemas import GistCreate, GistResponse
 from uuid import uuid4
+from datetime import datetime
 
 def test_gist_create_valid():
     data = {
@@ -10,6 +11,26 @@ def test_gist_create_valid():
     }
     model = GistCreate(**data)
     assert model.max_reads == 5
+    assert model.expiration_date == datetime(2025, 1, 1, 12, 0, 0)
+
+def test_gist_create_expiration_normalized_to_utc():
+    model = GistCreate(gist_metadata={}, expiration_date="2025-01-01T14:00:00+02:00")
+    assert model.expiration_date == datetime(2025, 1, 1, 12, 0, 0)
+    assert model.expiration_date.tzinfo is None
+
+    model = GistCreate(gist_metadata={}, expiration_date="2025-01-01T12:00:00")
+    assert model.expiration_date == datetime(2025, 1, 1, 12, 0, 0)
+
+def test_gist_create_rejects_unencodable_metadata():
+    GistCreate(gist_metadata={"n": 2**64 - 1})
+    with pytest.raises(ValueError):
+        GistCreate(gist_metadata={"n": 2**64})
+    with pytest.raises(ValueError):
+        GistCreate(gist_metadata={"nested": [{"n": -2**63 - 1}]})
+
+def test_gist_create_null_max_reads_uses_default():
+    model = GistCreate(gist_metadata={}, max_reads=None)
+    assert model.max_reads == 100
 
 def test_gist_create_defaults():
     data = {